@@ -1,23 +1,60 @@
 import threading
 import speech_recognition as sr
 from deep_translator import GoogleTranslator
-import queue, time, io, datetime, os
+import deep_translator.google as dt_google
+import requests
+from requests.adapters import HTTPAdapter
+import queue, time, io, datetime, os, re, shutil, subprocess, collections, array
 import asyncio
 import edge_tts
 import pygame
 import streamlit as st
 import logging
+import atexit
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from functools import lru_cache
+from types import SimpleNamespace
 
 
 # ================== LOGGING ==================
-logging.basicConfig(
-    filename='nova_debug.log',
-    level=logging.DEBUG,
-    format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s'
-)
+# Workers only enqueue records; a single listener thread does the file I/O.
+# Guarded because Streamlit re-executes this module on every rerun.
+_root_logger = logging.getLogger()
+if not any(isinstance(h, QueueHandler) for h in _root_logger.handlers):
+    _log_queue = queue.Queue(-1)
+    _file_handler = RotatingFileHandler('nova_debug.log', maxBytes=10_000_000, backupCount=3, encoding='utf-8')
+    _file_handler.setFormatter(logging.Formatter('%(asctime)s - %(threadName)s - %(levelname)s - %(message)s'))
+    _root_logger.addHandler(QueueHandler(_log_queue))
+    _root_logger.setLevel(logging.DEBUG)
+    _log_listener = QueueListener(_log_queue, _file_handler)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
 logger = logging.getLogger(__name__)
 logger.info("--- NOVA TRANSMIT STARTUP ---")
 
+# Optional streaming playback: needs sounddevice + an ffmpeg binary, else pygame buffered playback
+try:
+    import sounddevice as sd
+except Exception:
+    sd = None
+FFMPEG_BIN = shutil.which("ffmpeg")
+STREAM_TTS = sd is not None and FFMPEG_BIN is not None
+logger.info(f"TTS: Streaming playback {'enabled' if STREAM_TTS else 'disabled (buffered pygame)'}")
+
+# Optional local STT: faster-whisper removes the Google Speech round-trip when installed
+try:
+    import numpy as np
+    from faster_whisper import WhisperModel
+except Exception:
+    WhisperModel = None
+
+# Optional VAD capture: sounddevice callback stream + webrtcvad endpointing, else sr.Microphone/r.listen
+try:
+    import webrtcvad
+except Exception:
+    webrtcvad = None
+VAD_CAPTURE = sd is not None and webrtcvad is not None
+
 # ================== SETTINGS & CONSTS ==================
 CORRECTIONS = {
     "chat gpt": "ChatGPT",
@@ -56,12 +93,23 @@ ACCENTS = {
     "no": ["nb-NO"],
 }
 
+# Worker status codes; workers store small ints, text is only built when displayed
+W_CAPTURE, W_PROCESSOR, W_TTS, W_TRANSLATOR = range(4)
+WORKER_NAMES = ("Capture", "Processor", "TTS", "Translator")
+(ST_IDLE, ST_LISTENING, ST_PAUSED, ST_CALIBRATING, ST_ERROR, ST_OFF,
+ ST_PROCESSING, ST_TRANSLATING, ST_SILENCE, ST_PREPARING, ST_SPEAKING) = range(11)
+STATUS_LABELS = (
+    "Idle", "🎤 Listening", "⏸️ Paused", "🧬 Calibrating", "❌ Error", "❌ Off",
+    "📡 Processing", "☁️", "❓ Silence", "🔊 Preparing", "📢 Speaking"
+)
+
+
+# Single-pass matcher for all corrections (built once at import)
+_CORR_LOOKUP = {k.lower(): v for k, v in CORRECTIONS.items()}
+_CORR_RE = re.compile(r"\b(" + "|".join(re.escape(k) for k in _CORR_LOOKUP) + r")\b", re.IGNORECASE)
 
 def fix_words(text):
-    t = text.lower()
-    for k, v in CORRECTIONS.items():
-        t = t.replace(k, v.lower())
-    return t.title()
+    return _CORR_RE.sub(lambda m: _CORR_LOOKUP[m.group(0).lower()], text).title()
 
 # ================== STATE ==================
 class TranslatorState:
@@ -69,6 +117,7 @@ class TranslatorState:
         # Recognizer removed from here to prevent module-level memory issues
         self.tts_queue = queue.Queue()
         self.audio_chunk_queue = queue.Queue() 
+        self.text_queue = queue.Queue() # (segment, caption, src, tgt) for the translation worker
         self.stop_event = threading.Event()
         self.speaking_event = threading.Event()
         self.active_threads = []
@@ -76,11 +125,13 @@ class TranslatorState:
         self._manual_stop = False
         self.is_running = False
         
-        self.history = []
+        # Newest-first, written only by the timer worker; UI reads the immutable snapshot lock-free
+        self.history = collections.deque(maxlen=500)
+        self.history_snapshot = ()
         self.history_version = 0
         self.status_msg = "Ready"
         self.error_msg = ""
-        self.worker_status = {"Capture": "Idle", "Processor": "Idle", "TTS": "Idle"}
+        self.worker_status = array.array('b', [ST_IDLE] * len(WORKER_NAMES))
         self.mic_list = None # Cached list of microphones
         
         # Internal True Source of Truth
@@ -89,37 +140,64 @@ class TranslatorState:
             "speaker_b_lang": "hi", "speaker_b_locale": "hi-IN",
             "active_speaker": "A", "sensitivity": 120, "voice_speed": 1.0,
             "noise_reduction": False,
+            "local_stt": False, # Use faster-whisper (if installed) instead of Google Speech
             "device_index": None # Default to system default
         }
+        # Immutable view for workers; swapped by reference so reads need no lock
+        self.settings_version = 0
+        self.settings_snapshot = self._build_snapshot()
         
         self.live_caption = ""
         self.live_translation = ""
-        self.lock = threading.RLock() # Changed to RLock to prevent deadlocks
+        self.caption_segment = 0 # Bumped whenever live_caption is cleared; tags translation jobs
+        self.lock = threading.Lock() # Not re-entrant: never call a locking method while holding it
+        self.caption_cv = threading.Condition(self.lock) # Signalled whenever live_caption grows
         
         self.loop = None
+        self.tts_jobs = None # asyncio.Queue owned by the long-lived TTS task on self.loop
         self._hardware_initialized = False
 
-    def initialize_hardware(self):
-        with self.lock:
-            if self._hardware_initialized: return
+    def _initialize_hardware_locked(self):
+        # Caller (start_session) must hold self.lock
+        if self._hardware_initialized: return
+        
+        # ONLY init pygame if TTS is NOT disabled
+        if not self.settings.get('disable_tts_debug', False):
+            try: 
+                logger.info("HARDWARE: Initializing Pygame Mixer")
+                pygame.mixer.quit()
+                pygame.mixer.init(frequency=44100, size=-16, channels=1, buffer=1024) 
+            except Exception as e: 
+                logger.error(f"HARDWARE: Pygame Init Failed: {e}")
             
-            # ONLY init pygame if TTS is NOT disabled
-            if not self.settings.get('disable_tts_debug', False):
-                try: 
-                    logger.info("HARDWARE: Initializing Pygame Mixer")
-                    pygame.mixer.quit()
-                    pygame.mixer.init(frequency=44100, size=-16, channels=1, buffer=1024) 
-                except Exception as e: 
-                    logger.error(f"HARDWARE: Pygame Init Failed: {e}")
-                
-                try:
-                    logger.info("HARDWARE: Starting Asyncio Loop Thread")
-                    self.loop = asyncio.new_event_loop()
-                    threading.Thread(target=self._start_loop, daemon=True, name="AsyncLoop").start()
-                except Exception as e:
-                    logger.error(f"HARDWARE: Asyncio Init Failed: {e}")
+            try:
+                logger.info("HARDWARE: Starting Asyncio Loop Thread")
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self._start_loop, daemon=True, name="AsyncLoop").start()
+                # Bounded wait: we hold self.lock here, so a dead loop thread must not hang the UI
+                self.tts_jobs = asyncio.run_coroutine_threadsafe(_open_tts_server(), self.loop).result(timeout=5.0)
+            except Exception as e:
+                self.tts_jobs = None # TTS jobs fail fast in tts_worker instead of blocking
+                logger.error(f"HARDWARE: Asyncio Init Failed: {e!r}")
+
+        self._hardware_initialized = True
+
+    def update_settings(self, **changes):
+        with self.lock:
+            if all(self.settings.get(k) == v for k, v in changes.items()): return
+            self.settings.update(changes)
+            self.settings_snapshot = self._build_snapshot()
+            self.settings_version += 1
 
-            self._hardware_initialized = True
+    def _build_snapshot(self):
+        # Derived TTS parameters are resolved here, once per settings change, not per utterance
+        s = self.settings
+        return SimpleNamespace(
+            **s,
+            speaker_a_voice=resolve_voice(s['speaker_a_lang'], s['speaker_a_locale']),
+            speaker_b_voice=resolve_voice(s['speaker_b_lang'], s['speaker_b_locale']),
+            rate_str=rate_string(s['voice_speed'])
+        )
 
     def _start_loop(self):
         if self.loop:
@@ -128,16 +206,27 @@ class TranslatorState:
 
     def add_history(self, original, translated, src_lang, tgt_lang, speaker):
         with self.lock:
+            # Caption moved on (new speech or a reset) since the caller read it: don't finalize
+            if self.live_caption != original: return False
             ts = datetime.datetime.now().strftime("%H:%M:%S")
             entry = {
                 "timestamp": ts, "original": original, "translated": translated,
                 "src_lang": src_lang, "tgt_lang": tgt_lang,
                 "speaker": speaker, "confidence": 1.0
             }
-            self.history.insert(0, entry)
+            self.history.appendleft(entry)
+            self.history_snapshot = tuple(self.history)
             self.history_version += 1
             self.live_caption = ""
             self.live_translation = ""
+            self.caption_segment += 1
+            return True
+
+    def reset_caption(self):
+        with self.lock:
+            self.live_caption = ""
+            self.live_translation = ""
+            self.caption_segment += 1
 
     def start_session(self):
         with self.lock:
@@ -145,7 +234,7 @@ class TranslatorState:
             self.is_running = True
             
             # Ensure hardware components are ready
-            self.initialize_hardware()
+            self._initialize_hardware_locked()
             
             self.stop_event.clear()
             self._manual_stop = False
@@ -155,6 +244,7 @@ class TranslatorState:
             self.active_threads = [
                 threading.Thread(target=audio_capture_worker, args=(rid,), daemon=True, name="Capture"),
                 threading.Thread(target=streaming_processor_worker, args=(rid,), daemon=True, name="Processor"),
+                threading.Thread(target=translation_worker, args=(rid,), daemon=True, name="Translator"),
                 threading.Thread(target=finalization_timer_worker, args=(rid,), daemon=True, name="Timer"),
                 threading.Thread(target=tts_worker, args=(rid,), daemon=True, name="TTS")
             ]
@@ -180,6 +270,7 @@ class TranslatorState:
             self.is_running = False
             self._manual_stop = True
             self.stop_event.set()
+            self.caption_cv.notify_all()
             # Flush queues and stop music
             try: pygame.mixer.music.stop()
             except: pass
@@ -190,21 +281,25 @@ class TranslatorState:
             while not self.audio_chunk_queue.empty():
                 try: self.audio_chunk_queue.get_nowait()
                 except: break
+            while not self.text_queue.empty():
+                try: self.text_queue.get_nowait()
+                except: break
             
             self.speaking_event.clear()
             print("🛑 Session Stopped")
 
+    def worker_status_text(self):
+        # Language detail is derived from current settings at render time, not stored by workers
+        s = self.settings_snapshot
+        if s.active_speaker == "A": src, tgt = s.speaker_a_lang.upper(), s.speaker_b_lang.upper()
+        else: src, tgt = s.speaker_b_lang.upper(), s.speaker_a_lang.upper()
+        detail = {ST_TRANSLATING: f" {src} -> {tgt}", ST_SILENCE: f" ({src})"}
+        return {name: STATUS_LABELS[code] + detail.get(code, "") for name, code in zip(WORKER_NAMES, self.worker_status)}
+
     @property
     def threads_active(self):
         return self.is_running
 
-# State versioning replaced with robust session_state management
-if 'state_v24' not in st.session_state:
-    logger.info("STATE: Creating new TranslatorState (v24)")
-    st.session_state.state_v24 = TranslatorState()
-
-state = st.session_state.state_v24
-
 @st.cache_data
 def load_languages():
     try:
@@ -216,6 +311,12 @@ def load_languages():
 
 LANGS = load_languages()
 
+@st.cache_resource
+def _lang_keys():
+    # Shared (not copied) across reruns so the pickers don't rebuild/scan the key list
+    keys = tuple(LANGS)
+    return keys, {k: i for i, k in enumerate(keys)}
+
 @st.cache_resource
 def get_dynamic_voice_map():
     """
@@ -261,22 +362,159 @@ def get_dynamic_voice_map():
 
 VOICE_MAP = get_dynamic_voice_map()
 
+def resolve_voice(lang, locale):
+    # Prefer the chosen accent's voice, then any voice for the language, then English
+    return VOICE_MAP.get(locale) or VOICE_MAP.get(lang) or "en-US-AndrewNeural"
+
+def rate_string(speed):
+    return f"+{int((speed-1)*100)}%" if speed >= 1 else f"-{int((1-speed)*100)}%"
+
+# State is created after VOICE_MAP so the settings snapshot can carry resolved voices
+# State versioning replaced with robust session_state management
+if 'state_v24' not in st.session_state:
+    logger.info("STATE: Creating new TranslatorState (v24)")
+    st.session_state.state_v24 = TranslatorState()
+
+state = st.session_state.state_v24
+
+
+@st.cache_resource(show_spinner=False)
+def get_whisper_model():
+    """Loads one shared faster-whisper model on first use; None means fall back to Google Speech."""
+    if WhisperModel is None: return None
+    try:
+        logger.info("STT: Loading local Whisper model")
+        return WhisperModel("small", device="auto", compute_type="int8")
+    except Exception as e:
+        logger.error(f"STT: Whisper Init Failed, using Google Speech: {e}")
+        return None
+
+@st.cache_resource
+def get_http_session():
+    """One keep-alive session for all translate.google.com calls."""
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+    return session
+
+class _SessionRequests:
+    # deep_translator calls module-level requests.get() per translation (new TCP+TLS each time);
+    # this stands in for its `requests` module and routes get() through the shared session
+    def __init__(self, session): self.get = session.get
+    def __getattr__(self, name): return getattr(requests, name)
+
+dt_google.requests = _SessionRequests(get_http_session())
+
 # ================== AUDIO CORE ==================
 def flush_audio():
     state.stop_session() # Use the robust stop
     state.status_msg = "🔊 Audio Flushed"
 
 # ================== STREAMING WORKERS ==================
+def _transcribe_local(model, audio, lang):
+    # Whisper wants 16 kHz mono float32 and bare language codes (zh-CN -> zh)
+    pcm = np.frombuffer(audio.get_raw_data(convert_rate=16000, convert_width=2), np.int16).astype(np.float32) / 32768.0
+    segments, _ = model.transcribe(pcm, language=lang.split('-')[0], beam_size=1, vad_filter=True)
+    return " ".join(seg.text.strip() for seg in segments).strip()
+
+@lru_cache(maxsize=64)
+def _get_translator(src, tgt):
+    # One translator per language pair, reused across ticks. deep_translator stores the
+    # request text on the instance, so it is paired with a lock (see _translate)
+    return GoogleTranslator(source=src, target=tgt), threading.Lock()
+
+def _translate(src, tgt, text):
+    translator, lock = _get_translator(src, tgt)
+    with lock:
+        return translator.translate(text)
+
+# VAD capture parameters: 30 ms int16 frames at 16 kHz
+VAD_RATE = 16000
+VAD_FRAME_SAMPLES = VAD_RATE * 30 // 1000
+VAD_END_SILENCE_FRAMES = 500 // 30      # ~0.5 s of silence closes an utterance
+VAD_MIN_SPEECH_FRAMES = 300 // 30       # drop clicks/pops shorter than ~0.3 s
+VAD_MAX_SPEECH_FRAMES = 10_000 // 30    # force a cut at ~10 s
+VAD_PREROLL_FRAMES = 300 // 30          # ~0.3 s kept before the first voiced frame so onsets aren't clipped
+
+def _vad_capture_loop(run_id, device_idx):
+    frames_q = queue.Queue(maxsize=200) # ~6 s of backlog before frames are dropped
+    def on_audio(indata, frame_count, time_info, status):
+        try: frames_q.put_nowait(bytes(indata))
+        except queue.Full: pass
+
+    vad = webrtcvad.Vad(2)
+    speech = bytearray()
+    speech_frames = silence_frames = 0
+    preroll = collections.deque(maxlen=VAD_PREROLL_FRAMES)
+
+    def emit():
+        if speech_frames >= VAD_MIN_SPEECH_FRAMES:
+            state.audio_chunk_queue.put(sr.AudioData(bytes(speech), VAD_RATE, 2))
+            with state.lock: state.error_msg = ""
+
+    with sd.RawInputStream(samplerate=VAD_RATE, blocksize=VAD_FRAME_SAMPLES, dtype='int16',
+                           channels=1, device=device_idx, callback=on_audio):
+        logger.info("HARDWARE: VAD Input Stream Opened")
+        while not state.stop_event.is_set():
+            if run_id != state.run_id[0]: break
+            try: frame = frames_q.get(timeout=0.2)
+            except queue.Empty: continue
+
+            if state.speaking_event.is_set():
+                # Don't transcribe our own TTS output
+                state.worker_status[W_CAPTURE] = ST_PAUSED
+                speech.clear()
+                preroll.clear()
+                speech_frames = silence_frames = 0
+                continue
+            state.worker_status[W_CAPTURE] = ST_LISTENING
+
+            if len(frame) != VAD_FRAME_SAMPLES * 2: continue
+            if vad.is_speech(frame, VAD_RATE):
+                if not speech:
+                    # Speech onset: include the padding frames that webrtcvad hadn't flagged yet
+                    for f in preroll: speech += f
+                    preroll.clear()
+                speech += frame
+                speech_frames += 1
+                silence_frames = 0
+            elif speech:
+                speech += frame
+                silence_frames += 1
+            else:
+                preroll.append(frame)
+
+            if speech and (silence_frames >= VAD_END_SILENCE_FRAMES or speech_frames >= VAD_MAX_SPEECH_FRAMES):
+                emit()
+                speech.clear()
+                speech_frames = silence_frames = 0
+    logger.info("HARDWARE: VAD Input Stream Closed")
+
 def audio_capture_worker(run_id):
     logger.info(f"Capture Worker Started (Run {run_id})")
+    if VAD_CAPTURE:
+        while not state.stop_event.is_set():
+            if run_id != state.run_id[0]: break
+            try:
+                _vad_capture_loop(run_id, state.settings_snapshot.device_index)
+            except Exception as e:
+                logger.error(f"HARDWARE: VAD Capture Error: {e}")
+                with state.lock:
+                    state.error_msg = f"Device Init Error: {str(e)}"
+                    state.worker_status[W_CAPTURE] = ST_OFF
+                time.sleep(3)
+        state.worker_status[W_CAPTURE] = ST_IDLE
+        logger.info(f"Capture Worker Terminated (Run {run_id})")
+        return
+
     # Decouple recognizer - each thread gets its own
     r = sr.Recognizer()
     r.pause_threshold = 0.5 
+    local_v, s = state.settings_version, state.settings_snapshot
     
     while not state.stop_event.is_set():
         if run_id != state.run_id[0]: break
         try:
-            device_idx = state.settings.get('device_index')
+            device_idx = state.settings_snapshot.device_index
             logger.info(f"HARDWARE: Attempting to open microphone (Index: {device_idx})")
             
             # CRITICAL: Keep source open for the ENTIRE duration of the run_id session
@@ -286,17 +524,17 @@ def audio_capture_worker(run_id):
                 while not state.stop_event.is_set():
                     if run_id != state.run_id[0]: break
                     
-                    with state.lock: 
-                        s = state.settings.copy()
-                        r.energy_threshold = s['sensitivity']
-                        state.worker_status["Capture"] = "🎤 Listening" if not state.speaking_event.is_set() else "⏸️ Paused"
+                    if state.settings_version != local_v:
+                        local_v, s = state.settings_version, state.settings_snapshot
+                    r.energy_threshold = s.sensitivity
+                    state.worker_status[W_CAPTURE] = ST_PAUSED if state.speaking_event.is_set() else ST_LISTENING
                     
-                    if s['noise_reduction']:
+                    if s.noise_reduction:
                         try:
                             logger.info("HARDWARE: Calibrating noise...")
-                            state.worker_status["Capture"] = "🧬 Calibrating"
+                            state.worker_status[W_CAPTURE] = ST_CALIBRATING
                             r.adjust_for_ambient_noise(source, duration=1.0)
-                            with state.lock: state.settings['noise_reduction'] = False
+                            state.update_settings(noise_reduction=False)
                         except Exception as e:
                             logger.error(f"HARDWARE: Calibration Error: {e}")
                             with state.lock: state.error_msg = f"Calibration Error: {str(e)}"
@@ -307,9 +545,9 @@ def audio_capture_worker(run_id):
 
                     try:
                         # Short timeout to keep loop responsive to stop_event
-                        logger.debug("HARDWARE: Calling r.listen...")
+                        if logger.isEnabledFor(logging.DEBUG): logger.debug("HARDWARE: Calling r.listen...")
                         audio = r.listen(source, phrase_time_limit=3.0, timeout=1.0)
-                        logger.debug("HARDWARE: r.listen received audio")
+                        if logger.isEnabledFor(logging.DEBUG): logger.debug("HARDWARE: r.listen received audio")
                         state.audio_chunk_queue.put(audio)
                         with state.lock: state.error_msg = ""
                     except sr.WaitTimeoutError:
@@ -320,7 +558,7 @@ def audio_capture_worker(run_id):
                         logger.error(f"HARDWARE: Capture Loop Error: {e}")
                         with state.lock: 
                             state.error_msg = f"Capture Error: {str(e)}"
-                            state.worker_status["Capture"] = "❌ Error"
+                            state.worker_status[W_CAPTURE] = ST_ERROR
                         time.sleep(1)
                         continue
             logger.info("HARDWARE: Microphone Lock Released")
@@ -328,37 +566,79 @@ def audio_capture_worker(run_id):
             logger.error(f"HARDWARE: Device CRITICAL Error: {e}")
             with state.lock: 
                 state.error_msg = f"Device Init Error: {str(e)}"
-                state.worker_status["Capture"] = "❌ Off"
+                state.worker_status[W_CAPTURE] = ST_OFF
             # Exponential backoff on hardware crash
             time.sleep(3)
             
-    state.worker_status["Capture"] = "Idle"
+    state.worker_status[W_CAPTURE] = ST_IDLE
     logger.info(f"Capture Worker Terminated (Run {run_id})")
 
 def streaming_processor_worker(run_id):
     logger.info(f"Processor Worker Started (Run {run_id})")
     # Decouple recognizer - each thread gets its own
     r = sr.Recognizer()
-    last_translation_time = time.time()
+    local_v, s = state.settings_version, state.settings_snapshot
+    whisper_broken = False # Set after a Whisper runtime error; Google is used for the rest of the session
+    # Backlog coalescing: merge queued chunks into one recognize call, capped by audio duration
+    # (a single chunk is up to 3 s from r.listen or 10 s from VAD capture; one is never split)
+    max_batch_seconds = 15.0
+    pending = None
+    # Reused merge buffer (~15 s of 16 kHz int16); replaced, never resized, if a batch outgrows it
+    scratch = bytearray(16000 * 2 * 15)
     while not state.stop_event.is_set():
         if run_id != state.run_id[0]: break
         try:
-            audio = state.audio_chunk_queue.get(timeout=0.2)
-            state.worker_status["Processor"] = "📡 Processing"
-            with state.lock: s = state.settings.copy()
+            audio = pending or state.audio_chunk_queue.get(timeout=0.2)
+            pending = None
+            frames = [audio.frame_data]
+            bytes_per_sec = audio.sample_rate * audio.sample_width
+            batch_bytes = len(audio.frame_data)
+            while True:
+                try: extra = state.audio_chunk_queue.get_nowait()
+                except queue.Empty: break
+                if ((extra.sample_rate, extra.sample_width) != (audio.sample_rate, audio.sample_width)
+                        or (batch_bytes + len(extra.frame_data)) / bytes_per_sec > max_batch_seconds):
+                    pending = extra # Different format or batch full, handle on the next pass
+                    break
+                frames.append(extra.frame_data)
+                batch_bytes += len(extra.frame_data)
+            if len(frames) > 1:
+                logger.debug("PROCESSOR: Coalesced %d queued chunks", len(frames))
+                total = sum(len(f) for f in frames)
+                if total > len(scratch): scratch = bytearray(total)
+                off = 0
+                for f in frames:
+                    scratch[off:off + len(f)] = f
+                    off += len(f)
+                # Zero-copy view; safe because this thread finishes with `audio` before the next batch
+                audio = sr.AudioData(memoryview(scratch)[:total], audio.sample_rate, audio.sample_width)
+            state.worker_status[W_PROCESSOR] = ST_PROCESSING
+            if state.settings_version != local_v:
+                local_v, s = state.settings_version, state.settings_snapshot
             
-            if s['active_speaker'] == "A":
-                src_lang, src_locale = s['speaker_a_lang'], s['speaker_a_locale']
-                tgt_lang = s['speaker_b_lang']
+            if s.active_speaker == "A":
+                src_lang, src_locale = s.speaker_a_lang, s.speaker_a_locale
+                tgt_lang = s.speaker_b_lang
             else:
-                src_lang, src_locale = s['speaker_b_lang'], s['speaker_b_locale']
-                tgt_lang = s['speaker_a_lang']
+                src_lang, src_locale = s.speaker_b_lang, s.speaker_b_locale
+                tgt_lang = s.speaker_a_lang
 
             try:
-                # Use Google Speech Recognition
-                text = r.recognize_google(audio, language=src_locale)
+                text = None
+                # Model is loaded here on first use, never during page render
+                model = get_whisper_model() if s.local_stt and not whisper_broken else None
+                if model is not None:
+                    try: text = _transcribe_local(model, audio, src_lang)
+                    except ValueError as e: # Language Whisper doesn't know
+                        logger.debug(f"STT: Whisper skipped ({e})")
+                    except Exception as e: # e.g. CUDA/cuBLAS load failures with device="auto"
+                        logger.error(f"STT: Whisper Error, using Google Speech for this session: {e!r}")
+                        whisper_broken = True
+                if text is None:
+                    # Use Google Speech Recognition
+                    text = r.recognize_google(audio, language=src_locale)
                 if not text: 
-                    state.worker_status["Processor"] = "Idle"
+                    state.worker_status[W_PROCESSOR] = ST_IDLE
                     continue
                 
                 text = fix_words(text)
@@ -366,101 +646,268 @@ def streaming_processor_worker(run_id):
                 with state.lock:
                     state.live_caption = (state.live_caption + " " + text).strip()
                     current_caption = state.live_caption
+                    segment = state.caption_segment
+                    state.caption_cv.notify_all()
                 
-                # TRANSLATION OUTSIDE LOCK to prevent blocking
-                if time.time() - last_translation_time > 0.5:
-                    state.worker_status["Processor"] = f"☁️ {src_lang.upper()} -> {tgt_lang.upper()}"
-                    try:
-                        if src_lang == tgt_lang:
-                            translated_text = current_caption
-                        else:
-                            translator = GoogleTranslator(source=src_lang, target=tgt_lang)
-                            translated_text = translator.translate(current_caption)
-                        
-                        with state.lock:
-                            state.live_translation = translated_text
-                        last_translation_time = time.time()
-                    except Exception as e:
-                        with state.lock: state.error_msg = f"Translation Error: {str(e)}"
+                # Hand off to the translation worker so STT can take the next chunk immediately
+                state.text_queue.put((segment, current_caption, src_lang, tgt_lang))
                 
                 with state.lock: state.history_version += 1
             except Exception as e: 
-                state.worker_status["Processor"] = f"❓ Silence ({src_lang.upper()})"
+                state.worker_status[W_PROCESSOR] = ST_SILENCE
                 continue
         except: 
-            state.worker_status["Processor"] = "Idle"
+            state.worker_status[W_PROCESSOR] = ST_IDLE
             continue
 
+def translation_worker(run_id):
+    logger.info(f"Translator Worker Started (Run {run_id})")
+    # Delta translation: only the text appended since the last translation is sent out
+    last_key = None # (segment, src, tgt) the delta state belongs to
+    last_translated_caption = ""
+    last_translated_text = ""
+    while not state.stop_event.is_set():
+        if run_id != state.run_id[0]: break
+        try: job = state.text_queue.get(timeout=0.2)
+        except queue.Empty: continue
+        # Captions only grow, so anything older than the newest queued one is superseded
+        while True:
+            try: job = state.text_queue.get_nowait()
+            except queue.Empty: break
+        segment, current_caption, src_lang, tgt_lang = job
+        
+        # New segment (finalized / language changed) or not a whole-word extension -> start fresh
+        key = (segment, src_lang, tgt_lang)
+        prev = last_translated_caption
+        extends = current_caption.startswith(prev) and current_caption[len(prev):len(prev) + 1] in ("", " ")
+        if key != last_key or not extends:
+            last_key = key
+            last_translated_caption = ""
+            last_translated_text = ""
+        
+        state.worker_status[W_TRANSLATOR] = ST_TRANSLATING
+        try:
+            if src_lang == tgt_lang:
+                translated_text = current_caption
+            else:
+                delta = current_caption[len(last_translated_caption):].strip()
+                if delta:
+                    new_piece = _translate(src_lang, tgt_lang, delta) or ""
+                    translated_text = (last_translated_text + " " + new_piece).strip()
+                else:
+                    translated_text = last_translated_text
+            
+            with state.lock:
+                # Don't resurrect a caption that was finalized while we were translating
+                if state.caption_segment == segment:
+                    state.live_translation = translated_text
+            last_translated_caption = current_caption
+            last_translated_text = translated_text
+        except Exception as e:
+            with state.lock: state.error_msg = f"Translation Error: {str(e)}"
+        state.worker_status[W_TRANSLATOR] = ST_IDLE
+    
+    state.worker_status[W_TRANSLATOR] = ST_IDLE
+    logger.info(f"Translator Worker Terminated (Run {run_id})")
+
 def finalization_timer_worker(run_id):
     last_caption = ""
     silence_start = time.time()
+    silence_window = 1.0
+    recently_spoken = collections.OrderedDict() # hash((text, tgt)) -> time queued for TTS
+    local_v, s = state.settings_version, state.settings_snapshot
     while not state.stop_event.is_set():
         if run_id != state.run_id[0]: break
-        with state.lock:
+        with state.caption_cv:
+            # Sleep until the processor publishes new text or the silence window closes
+            if state.live_caption == last_caption:
+                timeout = silence_window - (time.time() - silence_start) if last_caption else 1.0
+                if timeout > 0: state.caption_cv.wait(timeout=timeout)
             current = state.live_caption
             translated = state.live_translation
-            s = state.settings.copy()
+        if state.settings_version != local_v:
+            local_v, s = state.settings_version, state.settings_snapshot
         
         if current and current == last_caption:
-            if time.time() - silence_start > 1.0: # Finalize after 2.2s of no new text
-                if s['active_speaker'] == "A":
-                    src, tgt = s['speaker_a_lang'], s['speaker_b_lang']
+            if time.time() - silence_start >= silence_window: # Finalize after 1s of no new text
+                if s.active_speaker == "A":
+                    src, tgt = s.speaker_a_lang, s.speaker_b_lang
                 else:
-                    src, tgt = s['speaker_b_lang'], s['speaker_a_lang']
+                    src, tgt = s.speaker_b_lang, s.speaker_a_lang
                 
-                state.add_history(current, translated, src, tgt, s['active_speaker'])
-                with state.lock:
-                    while not state.tts_queue.empty():
-                        try: state.tts_queue.get_nowait()
-                        except: break
-                    state.tts_queue.put((run_id, translated, tgt))
+                # Live translation was stitched from deltas; redo the full sentence once for quality
+                if src != tgt:
+                    try:
+                        translated = _translate(src, tgt, current) or translated
+                    except Exception as e:
+                        logger.error(f"Final Translation Error: {e}")
+                
+                if not state.add_history(current, translated, src, tgt, s.active_speaker):
+                    # Text arrived during the final translate; the next pass restarts the silence window
+                    logger.debug("TIMER: Caption changed during finalization, deferred")
+                    continue
+                
+                # Skip TTS if the same line was just spoken (repeat finalization under flaky VAD)
+                now = time.time()
+                h = hash((translated, tgt))
+                if h in recently_spoken and now - recently_spoken[h] < 5.0:
+                    logger.debug("TIMER: Duplicate utterance, TTS skipped")
+                else:
+                    recently_spoken[h] = now
+                    recently_spoken.move_to_end(h)
+                    if len(recently_spoken) > 32: recently_spoken.popitem(last=False)
+                    with state.lock:
+                        while not state.tts_queue.empty():
+                            try: state.tts_queue.get_nowait()
+                            except: break
+                        voice = s.speaker_b_voice if s.active_speaker == "A" else s.speaker_a_voice
+                        state.tts_queue.put((run_id, translated, tgt, voice))
                 last_caption = ""
         else:
             last_caption = current
             silence_start = time.time()
-        time.sleep(0.4)
+
+async def _open_tts_server():
+    # Queue must be created on the loop it is consumed from
+    jobs = asyncio.Queue()
+    asyncio.ensure_future(_tts_server(jobs))
+    return jobs
+
+# In-memory MP3 cache for repeated phrases, keyed by (voice, rate, text)
+TTS_CACHE_MAX_BYTES = 64 * 1024 * 1024
+TTS_CACHE_MAX_ITEMS = 256
+TTS_CACHE_TTL = 600.0
+
+async def _tts_server(jobs):
+    # One long-lived synthesis task for the whole app instead of a coroutine per utterance.
+    # MP3 chunks are handed to the job's sink as they arrive; None marks the end.
+    logger.info("TTS: Synthesis server started")
+    cache = collections.OrderedDict() # key -> (created, mp3 bytes); only touched by this task
+    cache_bytes = 0
+    while True:
+        text, voice, rate, sink = await jobs.get()
+        key = (voice, rate, text)
+        hit = cache.get(key)
+        if hit and time.time() - hit[0] < TTS_CACHE_TTL:
+            cache.move_to_end(key)
+            sink.put(hit[1])
+            sink.put(None)
+            continue
+        try:
+            parts = []
+            communicate = edge_tts.Communicate(text, voice, rate=rate)
+            async for chunk in communicate.stream():
+                if chunk["type"] == "audio":
+                    sink.put(chunk["data"])
+                    parts.append(chunk["data"])
+            sink.put(None)
+
+            if hit: cache_bytes -= len(cache.pop(key)[1])
+            mp3 = b"".join(parts)
+            cache[key] = (time.time(), mp3)
+            cache_bytes += len(mp3)
+            while cache_bytes > TTS_CACHE_MAX_BYTES or len(cache) > TTS_CACHE_MAX_ITEMS:
+                cache_bytes -= len(cache.popitem(last=False)[1][1])
+        except Exception as e:
+            logger.error(f"TTS: Synthesis Error: {e}")
+            sink.put(e)
+
+def _iter_tts_chunks(sink):
+    while True:
+        data = sink.get()
+        if data is None: return
+        if isinstance(data, Exception): raise data
+        yield data
+
+def _play_streaming(sink):
+    """Decode MP3 through ffmpeg while edge-tts is still sending, so playback starts on the first chunk."""
+    chunks = _iter_tts_chunks(sink)
+    first = next(chunks, None)
+    if first is None: return
+    decoder = subprocess.Popen(
+        [FFMPEG_BIN, "-loglevel", "quiet", "-f", "mp3", "-i", "pipe:0", "-f", "s16le", "-ac", "1", "-ar", "24000", "pipe:1"],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE
+    )
+    def feed():
+        try:
+            decoder.stdin.write(first)
+            for data in chunks:
+                if state.stop_event.is_set(): break
+                decoder.stdin.write(data)
+        except Exception as e:
+            logger.error(f"TTS: Decoder Feed Error: {e}")
+        finally:
+            try: decoder.stdin.close()
+            except: pass
+    threading.Thread(target=feed, daemon=True, name="TTSFeed").start()
+
+    state.speaking_event.set()
+    state.worker_status[W_TTS] = ST_SPEAKING
+    try:
+        with sd.RawOutputStream(samplerate=24000, channels=1, dtype="int16") as out:
+            while not state.stop_event.is_set():
+                pcm = decoder.stdout.read(4800) # 100 ms of audio
+                if not pcm: break
+                out.write(pcm)
+    finally:
+        decoder.kill()
+        decoder.wait()
 
 def tts_worker(run_id):
     logger.info(f"TTS Worker Started (Run {run_id})")
     while not state.stop_event.is_set():
         if run_id != state.run_id[0]: break
         try:
-            job_run, text, tgt_lang = state.tts_queue.get(timeout=0.2)
-            state.worker_status["TTS"] = "🔊 Preparing"
-            with state.lock: speed = state.settings['voice_speed']
+            job_run, text, tgt_lang, voice = state.tts_queue.get(timeout=0.2)
+            state.worker_status[W_TTS] = ST_PREPARING
+            # Voice is resolved with the settings snapshot; rate string likewise
+            rate = state.settings_snapshot.rate_str
             
-            # Use global VOICE_MAP. Fallback to English if absolutely not found.
-            # tgt_lang is usually a short code (e.g. 'fr', 'hi').
-            # VOICE_MAP contains both short codes and full locales.
-            voice = VOICE_MAP.get(tgt_lang, "en-US-AndrewNeural")
-
-            rate = f"+{int((speed-1)*100)}%" if speed >= 1 else f"-{int((1-speed)*100)}%"
+            sink = queue.Queue()
+            state.loop.call_soon_threadsafe(state.tts_jobs.put_nowait, (text, voice, rate, sink))
             
-            communicate = edge_tts.Communicate(text, voice, rate=rate)
-            buf = io.BytesIO()
-            async def save():
-                async for chunk in communicate.stream():
-                    if chunk["type"] == "audio": buf.write(chunk["data"])
-            asyncio.run_coroutine_threadsafe(save(), state.loop).result()
+            if STREAM_TTS:
+                _play_streaming(sink)
+                state.speaking_event.clear()
+                state.worker_status[W_TTS] = ST_IDLE
+                continue
             
-            buf.seek(0)
+            # One join into a bytes object; BytesIO(bytes) shares that buffer instead of copying it
+            buf = io.BytesIO(b"".join(_iter_tts_chunks(sink)))
             state.speaking_event.set()
-            state.worker_status["TTS"] = "📢 Speaking"
+            state.worker_status[W_TTS] = ST_SPEAKING
             pygame.mixer.music.load(buf)
             pygame.mixer.music.play()
+            # Block on stop_event instead of a 100 Hz sleep loop; stop wakes us immediately
             while pygame.mixer.music.get_busy():
-                if state.stop_event.is_set(): break
-                time.sleep(0.01)
+                if state.stop_event.wait(timeout=0.1): break
             state.speaking_event.clear()
-            state.worker_status["TTS"] = "Idle"
+            state.worker_status[W_TTS] = ST_IDLE
         except: 
             state.speaking_event.clear()
-            state.worker_status["TTS"] = "Idle"
+            state.worker_status[W_TTS] = ST_IDLE
 
 def stop_all():
     state.stop_session()
 
 # ================== UI ==================
+LANG_BADGE_TPL = ('<div style="text-align:right; margin-bottom: -15px;"><span style="background:#00d4ff; color:#060709; padding:2px 10px; '
+                  'border-radius:15px; font-size:0.8em; font-weight:bold; position:relative; z-index:10;">{src} ➔ {tgt}</span></div>')
+CAPTION_TPL = ('<div class="caption-box"> <div style="font-size:1.4em;">{caption}</div>'
+               '<div style="color:#00d4ff; font-style:italic; font-size:1.2em;">{translation}</div> </div>')
+HIST_TPL = ('<div style="padding:10px; border-bottom:1px solid rgba(255,255,255,0.05);">'
+            '<small>{timestamp} | Station {speaker}</small><br>'
+            '<b>{original}</b> → <span style="color:#00d4ff">{translated}</span></div>')
+
+def render_history_html():
+    # History only changes on finalization; rebuild the HTML only when the snapshot object changes
+    snap = state.history_snapshot
+    cached = st.session_state.get("history_html")
+    if cached is None or cached[0] is not snap:
+        cached = (snap, "".join(HIST_TPL.format_map(h) for h in snap))
+        st.session_state.history_html = cached
+    return cached[1]
+
 def main():
     logger.debug("RENDER: Main loop started")
     st.set_page_config("Nova Transmit Pro", "🛰️", layout="wide")
@@ -499,37 +946,41 @@ def main():
             if st.button("🛑 TERMINATE STREAM", use_container_width=True):
                 st.session_state.running = False
                 state.stop_session()
+            for name, label in state.worker_status_text().items():
+                st.caption(f"{name}: {label}")
 
       
         st.subheader("🎚️ Calibration")
         v_speed = st.slider("Speech Rate", 0.5, 2.0, state.settings['voice_speed'])
-        v_sens = st.slider("Mic Gain (Sensitivity)", 10, 800, state.settings['sensitivity'])
+        # webrtcvad does its own endpointing and noise handling, so gain/calibration only apply to r.listen capture
+        vad_help = "Not used while VAD capture (webrtcvad) is active." if VAD_CAPTURE else None
+        v_sens = st.slider("Mic Gain (Sensitivity)", 10, 800, state.settings['sensitivity'], disabled=VAD_CAPTURE, help=vad_help)
         
-        with state.lock:
-            state.settings['voice_speed'] = v_speed
-            state.settings['sensitivity'] = v_sens
+        state.update_settings(voice_speed=v_speed, sensitivity=v_sens)
         
-        if st.button("🎵 Calibrate Mic"): 
-            with state.lock: 
-                state.settings['noise_reduction'] = True
-                state.error_msg = "Calibrating..."
+        if st.button("🎵 Calibrate Mic", disabled=VAD_CAPTURE, help=vad_help): 
+            state.update_settings(noise_reduction=True)
+            with state.lock: state.error_msg = "Calibrating..."
         if st.button("🧹 Flush Audio"): flush_audio()
+        
+        if WhisperModel is not None:
+            use_local = st.checkbox("Local Speech Recognition (Whisper)", value=state.settings['local_stt'],
+                                    help="Transcribe on this machine with faster-whisper. The model loads on first use.")
+            state.update_settings(local_stt=use_local)
 
         st.divider()
  
+    lang_keys, lang_idx = _lang_keys()
     c1, c2 = st.columns(2)
     with c1:
         is_a = state.settings['active_speaker'] == "A"
         st.markdown(f'<div class="speaker-box {"active-box" if is_a else ""}">🎙️ Station A </div>', unsafe_allow_html=True)
         
         # Language Selection
-        lang_a = st.selectbox("Language A", list(LANGS.keys()), index=list(LANGS.keys()).index(state.settings['speaker_a_lang']), format_func=lambda x: LANGS[x], key="sa_lang")
+        lang_a = st.selectbox("Language A", lang_keys, index=lang_idx[state.settings['speaker_a_lang']], format_func=lambda x: LANGS[x], key="sa_lang")
         if lang_a != state.settings['speaker_a_lang']:
-            with state.lock:
-                state.settings['speaker_a_lang'] = lang_a
-                state.settings['speaker_a_locale'] = ACCENTS.get(lang_a, [lang_a])[0]
-                state.live_caption = ""
-                state.live_translation = ""
+            state.update_settings(speaker_a_lang=lang_a, speaker_a_locale=ACCENTS.get(lang_a, [lang_a])[0])
+            state.reset_caption()
         
         # Accent Selection
         acc_options_a = ACCENTS.get(state.settings['speaker_a_lang'], [state.settings['speaker_a_lang']])
@@ -537,13 +988,11 @@ def main():
         except: acc_idx_a = 0
         acc_a = st.selectbox("Accent A", acc_options_a, index=acc_idx_a, key="sa_acc")
         if acc_a != state.settings['speaker_a_locale']:
-            with state.lock: 
-                state.settings['speaker_a_locale'] = acc_a
-                state.live_caption = ""
-                state.live_translation = ""
+            state.update_settings(speaker_a_locale=acc_a)
+            state.reset_caption()
             
         if st.button("Activate Station A", disabled=is_a, use_container_width=True):
-            with state.lock: state.settings['active_speaker'] = "A"
+            state.update_settings(active_speaker="A")
             flush_audio()
 
     with c2:
@@ -551,13 +1000,10 @@ def main():
         st.markdown(f'<div class="speaker-box {"active-box" if is_b else ""}">🎙️ Station B </div>', unsafe_allow_html=True)
         
         # Language Selection
-        lang_b = st.selectbox("Language B", list(LANGS.keys()), index=list(LANGS.keys()).index(state.settings['speaker_b_lang']), format_func=lambda x: LANGS[x], key="sb_lang")
+        lang_b = st.selectbox("Language B", lang_keys, index=lang_idx[state.settings['speaker_b_lang']], format_func=lambda x: LANGS[x], key="sb_lang")
         if lang_b != state.settings['speaker_b_lang']:
-            with state.lock:
-                state.settings['speaker_b_lang'] = lang_b
-                state.settings['speaker_b_locale'] = ACCENTS.get(lang_b, [lang_b])[0]
-                state.live_caption = ""
-                state.live_translation = ""
+            state.update_settings(speaker_b_lang=lang_b, speaker_b_locale=ACCENTS.get(lang_b, [lang_b])[0])
+            state.reset_caption()
 
         # Accent Selection
         acc_options_b = ACCENTS.get(state.settings['speaker_b_lang'], [state.settings['speaker_b_lang']])
@@ -565,13 +1011,11 @@ def main():
         except: acc_idx_b = 0
         acc_b = st.selectbox("Accent B", acc_options_b, index=acc_idx_b, key="sb_acc")
         if acc_b != state.settings['speaker_b_locale']:
-            with state.lock: 
-                state.settings['speaker_b_locale'] = acc_b
-                state.live_caption = ""
-                state.live_translation = ""
+            state.update_settings(speaker_b_locale=acc_b)
+            state.reset_caption()
             
         if st.button("Activate Station B", disabled=is_b, use_container_width=True):
-            with state.lock: state.settings['active_speaker'] = "B"
+            state.update_settings(active_speaker="B")
             flush_audio()
 
     st.subheader("📺 Continuous Subtitle Feed")
@@ -586,18 +1030,15 @@ def main():
         else:
             src_name, tgt_name = LANGS.get(s['speaker_b_lang'], "N/A"), LANGS.get(s['speaker_a_lang'], "N/A")
             
-        st.markdown(f'<div style="text-align:right; margin-bottom: -15px;"><span style="background:#00d4ff; color:#060709; padding:2px 10px; border-radius:15px; font-size:0.8em; font-weight:bold; position:relative; z-index:10;">{src_name} ➔ {tgt_name}</span></div>', unsafe_allow_html=True)
+        st.markdown(LANG_BADGE_TPL.format(src=src_name, tgt=tgt_name), unsafe_allow_html=True)
         
-        st.markdown(f'<div class="caption-box"> <div style="font-size:1.4em;">{state.live_caption or "Waiting for voice..."}</div>'
-                    f'<div style="color:#00d4ff; font-style:italic; font-size:1.2em;">{state.live_translation}</div> </div>', unsafe_allow_html=True)
+        st.markdown(CAPTION_TPL.format(caption=state.live_caption or "Waiting for voice...", translation=state.live_translation), unsafe_allow_html=True)
     else: st.info("System Offline. Click Initiate Stream to start.")
 
     st.divider()
     with st.container(height=350):
-        for h in state.history:
-            st.markdown(f'<div style="padding:10px; border-bottom:1px solid rgba(255,255,255,0.05);">'
-                        f'<small>{h["timestamp"]} | Station {h["speaker"]}</small><br>'
-                        f'<b>{h["original"]}</b> → <span style="color:#00d4ff">{h["translated"]}</span></div>', unsafe_allow_html=True)
+        if state.history_snapshot:
+            st.markdown(render_history_html(), unsafe_allow_html=True)
 
 
 